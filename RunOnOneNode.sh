@@ -7,6 +7,9 @@
 module load Python
 module load parallel
 
+# the repository root (where the job is submitted from) and SimPy
+export PYTHONPATH=$SLURM_SUBMIT_DIR:$HOME/SimPy:$PYTHONPATH
+
 NUM_TASKS=${SLURM_NTASKS}
 
 SRUN="srun --export=all -n1 --exclusive"
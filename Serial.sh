@@ -6,6 +6,9 @@
 #SBATCH -n 15
 module load Python
 
+# the repository root (where the job is submitted from) and SimPy
+export PYTHONPATH=$SLURM_SUBMIT_DIR:$HOME/SimPy:$PYTHONPATH
+
 NUM_TASKS=${SLURM_NTASKS}
 
 SRUN="srun --export=all -n1 --exclusive"
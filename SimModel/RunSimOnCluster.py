@@ -1,7 +1,5 @@
 import sys
-sys.path.insert(0, '/home/ry87/SimPy')
-import SimClasses as PP
-import sys
+import SimModel.SimClasses as PP
 
 VAL = 0
 ARR_NUM = int(sys.argv[1].split(' ')[VAL])
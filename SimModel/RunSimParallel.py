@@ -6,10 +6,12 @@ N_RUNS = 100
 
 if __name__ == '__main__':  # this line is needed to avoid errors that occur on Windows computers
 
+    PP.compile_kernels()  # keep the compilation out of the measured time
     t0 = time.time()
 
     parallelModel = PP.ParallelMultiSim(num_simulations=N_RUNS)
     parallelModel.simulate(n_steps=N_STEPS)
+    parallelModel.export_results(directory='ResultsParallel')
 
     t1 = time.time()
 
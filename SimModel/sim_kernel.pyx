@@ -0,0 +1,46 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+# Cython version of the simulation kernel in SimClasses.py for machines without numba.
+# Build it in place from this directory with: python setup.py build_ext --inplace
+from cpython.pycapsule cimport PyCapsule_GetPointer
+from libc.math cimport sqrt
+from numpy.random cimport bitgen_t
+from numpy.random.c_distributions cimport random_beta
+from numpy.random import PCG64
+
+
+def simulate_kernel(long seed, Py_ssize_t n_steps):
+    # sum of n_steps uniform(0, 1) + beta(1, 2) draws taken straight from the bit generator;
+    # beta(1, 2) has the inverse cdf 1 - sqrt(1 - v)
+    cdef Py_ssize_t i
+    cdef double s = 0.0, u, v
+    cdef bitgen_t *rng
+    cdef const char *capsule_name = "BitGenerator"
+
+    bit_generator = PCG64(seed)
+    rng = <bitgen_t *> PyCapsule_GetPointer(bit_generator.capsule, capsule_name)
+    with bit_generator.lock, nogil:
+        for i in range(n_steps):
+            # separate statements fix the draw order (u, then v) that SimClasses._numpy_kernel
+            # reproduces; C leaves the order of calls within one expression unspecified
+            u = rng.next_double(rng.state)
+            v = rng.next_double(rng.state)
+            s += u + 1.0 - sqrt(1.0 - v)
+    return s
+
+
+def beta_kernel(long seed, Py_ssize_t n_steps, double a, double b):
+    # sum of n_steps uniform(0, 1) + beta(a, b) draws; numpy's beta sampler uses johnk's
+    # algorithm when a, b <= 1 and otherwise the ratio of its ziggurat-based gamma variates
+    cdef Py_ssize_t i
+    cdef double s = 0.0, u, x
+    cdef bitgen_t *rng
+    cdef const char *capsule_name = "BitGenerator"
+
+    bit_generator = PCG64(seed)
+    rng = <bitgen_t *> PyCapsule_GetPointer(bit_generator.capsule, capsule_name)
+    with bit_generator.lock, nogil:
+        for i in range(n_steps):
+            u = rng.next_double(rng.state)
+            x = random_beta(rng, a, b)
+            s += u + x
+    return s